@@ -1,12 +1,29 @@
+import bisect
+import codecs
+import locale
 import os
+import re
+import select
 import signal
+import stat
 import string
 import sys
+import tempfile
 import termios
+from array import array
 from dataclasses import dataclass
 from enum import Enum, auto
+from itertools import accumulate, zip_longest
 from types import FrameType, TracebackType
-from typing import Any, Generator, Iterable, Optional, TextIO
+from typing import Any, Callable, Iterator, Optional, TextIO, Union
+
+_CHAR_TYPECODE: str = "w" if sys.version_info >= (3, 13) else "u"
+_OFFSET_TYPECODE = "q"
+_WHITESPACE_RE = re.compile(f"[{re.escape(string.whitespace)}]")
+_NON_WHITESPACE_RE = re.compile(f"[^{re.escape(string.whitespace)}]")
+_PRINTABLE = frozenset(string.printable)
+
+_EscapeNode = dict[str, "_EscapeNode"]
 
 
 @dataclass
@@ -14,28 +31,43 @@ class File:
     text: str
     path: str
     encoding: str = "ascii"
+    newline: str = "\n"
 
 
 class Editor:
     TAB_WIDTH = 4
 
     _mode: "EditorMode"
-    _text: str
+    _text: "GapBuffer"
     _file_path: str
     _encoding: str
+    _newline: str
+    _modified: bool
+    _dirty: bool
+    _rendered_state: tuple[int, int, "EditorMode"]
     _cursor: int
-    _lines: list["EditorLine"]
+    _column_cache: Optional[tuple[int, int, int]]
+    _line_begins: "array[int]"
     _line_idx: int
+    _line_pivot: int
+    _line_shift: int
 
     def __init__(self, file: File) -> None:
         self._mode = EditorMode.NORMAL
-        self._text = file.text
+        self._text = GapBuffer(file.text)
         self._file_path = file.path
         self._encoding = file.encoding
+        self._newline = file.newline
+        self._modified = False
+        self._dirty = True
         self._cursor = 0
+        self._column_cache = None
         self._line_idx = 0
-        self._lines = []
-        self._recompute_lines()
+        self._rendered_state = (0, 0, self._mode)
+        self._line_begins = array(_OFFSET_TYPECODE)
+        self._line_pivot = 0
+        self._line_shift = 0
+        self._recompute_lines(file.text)
 
     @property
     def mode(self):
@@ -43,25 +75,41 @@ class Editor:
 
     @property
     def cursor_column(self) -> int:
+        cache = self._column_cache
+        if cache is not None and cache[0] == self._cursor and cache[1] == self._line_idx:
+            return cache[2]
+
         column = 0
-        if not self._lines:
+        if not self._line_begins:
             column = self._cursor
         else:
-            column = self._cursor - self._lines[self._line_idx].begin
+            column = self._cursor - self._line_start(self._line_idx)
+        self._column_cache = (self._cursor, self._line_idx, column + 1)
         return column + 1
 
     @property
     def cursor_line(self) -> int:
         return self._line_idx + 1
 
+    @property
+    def dirty(self) -> bool:
+        return self._dirty or self._rendered_state != (self._cursor, self._line_idx, self._mode)
+
+    @property
+    def line_count(self) -> int:
+        count = len(self._line_begins)
+        if count > 1 and self._line_start(count - 1) == len(self._text):
+            count -= 1
+        return count
+
     def switch_to_insert_mode(self, append: bool = False):
         if self.mode == EditorMode.INSERT:
             return
 
         self._mode = EditorMode.INSERT
         if append:
-            current_line = self._get_current_line()
-            if self._cursor < current_line.end:
+            _, end = self._current_line_range()
+            if self._cursor < end:
                 self._cursor += 1
 
     def switch_to_normal_mode(self):
@@ -76,48 +124,35 @@ class Editor:
             return
 
         idx = max(self._cursor - 1, 0)
-        self._text = self._text[:idx] + self._text[idx + 1:]
-        total_lines = len(self._lines)
-        self._recompute_lines()
-        if total_lines > len(self._lines):
-            self._line_idx = max(self._line_idx - 1, 0)
-
-        self._recompute_lines()
+        self._apply_edit(idx, 1)
         self._cursor = idx
+        self._refresh_line_idx()
 
     def delete_character(self) -> None:
-        current_line = self._get_current_line()
-        if len(current_line) <= 0:
+        begin, end = self._current_line_range()
+        if end <= begin:
             return
 
-        idx = self._cursor
-        self._text = self._text[:idx] + self._text[idx + 1:]
-        total_lines = len(self._lines)
-        self._recompute_lines()
-        if total_lines > len(self._lines):
-            self._line_idx = max(self._line_idx - 1, 0)
-
-        current_line = self._get_current_line()
-        self._cursor = min(self._cursor, current_line.end)
+        self._apply_edit(self._cursor, 1)
+        self._refresh_line_idx()
+        _, end = self._current_line_range()
+        self._cursor = min(self._cursor, end)
 
     def delete_line(self) -> None:
-        current_line = self._get_current_line()
-        self._text = self._text[:current_line.begin] + self._text[current_line.end:]
-        self._recompute_lines()
-        self._line_idx = min(self._line_idx, len(self._lines) - 1)
-        current_line = self._get_current_line()
-        self._cursor = current_line.begin
+        begin, end = self._current_line_range()
+        self._apply_edit(begin, end - begin)
+        self._line_idx = min(self._line_idx, self.line_count - 1)
+        self._cursor, _ = self._current_line_range()
 
     def insert(self, text: str) -> None:
+        if len(text) == 1 and text != "\n" and text != "\t":
+            self._insert_character(text)
+            return
+
         text = text.replace("\t", " " * Editor.TAB_WIDTH)
-        self._text = self._text[:self._cursor] + text + self._text[self._cursor:]
+        self._apply_edit(self._cursor, 0, text)
         self._cursor += len(text)
-        total_lines = len(self._lines)
-        self._recompute_lines()
-        if len(self._lines) > total_lines:
-            self._line_idx = max(min(self._line_idx + 1, len(self._lines) - 1), 0)
-            current_line = self._get_current_line()
-            self._cursor = current_line.begin
+        self._refresh_line_idx()
 
     def insert_newline_above(self):
         self.move_to_beginning_of_line()
@@ -125,21 +160,36 @@ class Editor:
         self.move_up()
 
     def insert_newline_below(self):
-        current_line = self._get_current_line()
-        self._cursor = current_line.end
+        _, end = self._current_line_range()
+        self._cursor = self._current_content_end(end)
         self.insert("\n")
 
     def save(self) -> None:
-        with open(self._file_path, "w", encoding=self._encoding) as fobj:
-            fobj.write(self._text)
+        if not self._modified and os.path.exists(self._file_path):
+            return
+
+        self._write_file(list(self._text.chunks()))
+        self._modified = False
 
-    def get_lines(self) -> Generator[str, None, None]:
-        for lv in self._lines:
-            yield self._text[lv.begin:lv.end]
+    def mark_clean(self) -> None:
+        self._dirty = False
+        self._rendered_state = (self._cursor, self._line_idx, self._mode)
+
+    def get_lines(
+            self,
+            first: int,
+            last: int,
+            start: int = 0,
+            stop: Optional[int] = None) -> Iterator[str]:
+        for idx in range(max(first, 0), min(last, self.line_count)):
+            begin, end = self._line_start(idx), self._line_end(idx)
+            if stop is not None:
+                end = min(begin + stop, end)
+            yield self._text[min(begin + start, end):end]
 
     def move_left(self) -> None:
-        curr_line = self._get_current_line()
-        if self._cursor > curr_line.begin:
+        begin, _ = self._current_line_range()
+        if self._cursor > begin:
             self._cursor -= 1
 
     def move_down(self) -> None:
@@ -149,9 +199,9 @@ class Editor:
         self._go_to_line(self._line_idx - 1)
 
     def move_right(self) -> None:
-        current_line = self._get_current_line()
+        _, end = self._current_line_range()
         nc = self._cursor + 1
-        if nc < current_line.end and self._text[nc] != "\n":
+        if nc < self._current_content_end(end):
             self._cursor = nc
 
     def move_word_forward(self) -> None:
@@ -161,132 +211,224 @@ class Editor:
 
     def move_word_backward(self) -> None:
         cursor = self._skip_whitespace_backward()
-        nxt_cursor = 0
-        while cursor > 0:
-            if self._text[cursor] in string.whitespace:
-                nxt_cursor = cursor + 1
-                break
-
-            cursor -= 1
-
-        self._cursor = nxt_cursor
+        self._cursor = self._text.rsearch_char(_WHITESPACE_RE, 0, cursor + 1) + 1
+        self._refresh_line_idx()
         self._correct_cursor_position()
 
     def move_to_end_of_word(self) -> None:
         cursor = self._skip_whitespace_forward()
-        current_line = self._get_current_line()
-        new_cursor = current_line.end - 1
-        while cursor < current_line.end - 1:
-            if self._text[cursor] in string.whitespace:
-                new_cursor = cursor - 1
-                break
-
-            cursor += 1
-
-        self._cursor = new_cursor
+        _, end = self._current_line_range()
+        idx = self._text.search_char(_WHITESPACE_RE, cursor, end - 1)
+        self._cursor = idx - 1 if idx >= 0 else end - 1
         self._correct_cursor_position()
 
     def move_paragraph_forward(self) -> None:
-        nxt_cursor = self._cursor + 1
-        while nxt_cursor + 1 < len(self._text):
-            if self._text[nxt_cursor] == "\n":
-                self._line_idx += 1
-                if self._text[nxt_cursor-1] == "\n":
-                    break
-
-            nxt_cursor += 1
+        idx = self._text.find("\n\n", self._cursor)
+        if idx >= 0 and idx + 2 < len(self._text):
+            self._cursor = idx + 1
+        else:
+            self._cursor = max(len(self._text) - 1, 0)
 
-        self._cursor = min(nxt_cursor, len(self._text) - 1)
+        self._refresh_line_idx()
         self._correct_cursor_position()
 
     def move_paragraph_backward(self) -> None:
-        nxt_cursor = self._cursor - 1
-        while nxt_cursor > 0:
-            if self._text[nxt_cursor] == "\n":
-                self._line_idx -= 1
-                if self._text[nxt_cursor+1] == "\n":
-                    break
-
-            nxt_cursor -= 1
+        idx = self._text.rfind("\n\n", 0, self._cursor + 1)
+        if idx > 0:
+            self._cursor = idx
+        else:
+            self._cursor = 0
 
-        self._cursor = max(nxt_cursor, 0)
+        self._refresh_line_idx()
         self._correct_cursor_position()
 
     def move_to_beginning_of_line(self) -> None:
-        current_line = self._get_current_line()
-        self._cursor = current_line.begin
+        self._cursor, _ = self._current_line_range()
 
     def move_to_end_of_line(self) -> None:
-        current_line = self._get_current_line()
-        self._cursor = current_line.end - 1
+        _, end = self._current_line_range()
+        self._cursor = end - 1
         self._correct_cursor_position()
 
-    def _recompute_lines(self) -> None:
-        if self._lines is None:
-            self._lines = []
-
-        self._lines.clear()
-        for idx, ch in enumerate(self._text):
-            is_newline = ch == "\n"
-            is_last_character = idx + 1 == len(self._text)
-            if is_newline or is_last_character:
-                begin = 0 if not self._lines else self._lines[-1].end
-                end = idx + 1
-                self._lines.append(EditorLine(begin, end))
+    def _write_file(self, chunks: list[str]) -> None:
+        path = os.path.realpath(self._file_path)
+        if os.path.exists(path) and self._replace_file(path, chunks):
+            return
 
-        if not self._lines:
-            self._lines.append(EditorLine(0, 0))
+        data = "".join(chunks).replace("\n", self._newline).encode(self._encoding)
+        with open(path, "wb") as fobj:
+            fobj.write(data)
+
+    def _replace_file(self, path: str, chunks: list[str]) -> bool:
+        st = os.stat(path)
+        if st.st_nlink > 1:
+            return False
+
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                prefix=f".{os.path.basename(path)}.", dir=os.path.dirname(path))
+        except PermissionError:
+            return False
+
+        try:
+            with os.fdopen(fd, "w", encoding=self._encoding, newline=self._newline) as fobj:
+                fobj.writelines(chunks)
+                fobj.flush()
+                os.fsync(fobj.fileno())
+            os.chmod(tmp_path, stat.S_IMODE(st.st_mode))
+            try:
+                os.chown(tmp_path, st.st_uid, st.st_gid)
+            except PermissionError:
+                os.unlink(tmp_path)
+                return False
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return True
+
+    def _recompute_lines(self, text: str) -> None:
+        lengths = (len(line) + 1 for line in text.split("\n"))
+        begins = array(_OFFSET_TYPECODE, accumulate(lengths, initial=0))
+        begins.pop()
+        self._line_begins = begins
+        self._line_pivot = len(begins)
+        self._line_shift = 0
+
+    def _apply_edit(self, pos: int, removed_len: int, text: str = "") -> None:
+        removed = self._text[pos:pos + removed_len]
+        if removed:
+            self._text.delete(pos, len(removed))
+            self._lines_removed(pos, removed)
+        if text:
+            self._text.insert(pos, text)
+            self._lines_inserted(pos, text)
+        self._modified = True
+        self._dirty = True
+        self._column_cache = None
+
+    def _insert_character(self, char: str) -> None:
+        self._text.insert(self._cursor, char)
+        idx = self._find_line(self._cursor)
+        self._shift_lines(idx + 1, 1)
+        self._modified = True
+        self._dirty = True
+        self._column_cache = None
+        self._cursor += 1
+        self._line_idx = idx
+
+    def _lines_inserted(self, pos: int, text: str) -> None:
+        idx = self._find_line(pos)
+        self._shift_lines(idx + 1, len(text))
+        begins = array(_OFFSET_TYPECODE)
+        offset = text.find("\n")
+        while offset >= 0:
+            begins.append(pos + offset + 1)
+            offset = text.find("\n", offset + 1)
+
+        self._line_begins[idx + 1:idx + 1] = begins
+        self._line_pivot += len(begins)
+
+    def _lines_removed(self, pos: int, text: str) -> None:
+        idx = self._find_line(pos)
+        count = text.count("\n")
+        self._shift_lines(idx + count + 1, -len(text))
+        if count:
+            del self._line_begins[idx + 1:idx + count + 1]
+            self._line_pivot -= count
+
+    def _shift_lines(self, first: int, delta: int) -> None:
+        begins = self._line_begins
+        first = min(first, len(begins))
+        if first < self._line_pivot:
+            if self._line_shift:
+                for idx in range(first, self._line_pivot):
+                    begins[idx] -= self._line_shift
+        else:
+            for idx in range(self._line_pivot, first):
+                begins[idx] += self._line_shift
+        self._line_pivot = first
+
+        self._line_shift += delta
+        if self._line_pivot == len(begins):
+            self._line_shift = 0
+
+    def _line_start(self, idx: int) -> int:
+        shift = 0 if idx < self._line_pivot else self._line_shift
+        return self._line_begins[idx] + shift
+
+    def _line_end(self, idx: int) -> int:
+        if idx + 1 < len(self._line_begins):
+            return self._line_start(idx + 1)
+        return len(self._text)
+
+    def _find_line(self, pos: int) -> int:
+        idx = bisect.bisect_right(self._line_begins, pos, 0, self._line_pivot)
+        if idx == self._line_pivot:
+            idx = bisect.bisect_right(self._line_begins, pos - self._line_shift, self._line_pivot)
+        return max(idx - 1, 0)
+
+    def _find_visible_line(self, pos: int) -> int:
+        return min(self._find_line(pos), self.line_count - 1)
+
+    def _refresh_line_idx(self) -> None:
+        if 0 <= self._line_idx < self.line_count:
+            idx = self._line_idx
+            if self._line_start(idx) <= self._cursor < self._line_end(idx):
+                return
+        self._line_idx = self._find_visible_line(self._cursor)
 
     def _go_to_line(self, line: int) -> None:
-        current_line = self._get_current_line()
-        offset = max(self._cursor - current_line.begin, 0)
-        self._line_idx = max(min(line, len(self._lines) - 1), 0)
-        current_line = self._get_current_line()
-        self._cursor = max(min(current_line.begin + offset, max(current_line.end - 1, current_line.begin)), 0)
+        begin, _ = self._current_line_range()
+        offset = max(self._cursor - begin, 0)
+        self._line_idx = max(min(line, self.line_count - 1), 0)
+        begin, end = self._current_line_range()
+        self._cursor = max(min(begin + offset, max(end - 1, begin)), 0)
         self._correct_cursor_position()
 
     def _go_to_coloumn(self, column: int) -> None:
-        curr_line = self._get_current_line()
-        column = max(min(column, curr_line.end - curr_line.begin), 0)
-        self._cursor = curr_line.begin + column
+        begin, end = self._current_line_range()
+        column = max(min(column, end - begin), 0)
+        self._cursor = begin + column
 
-    def _get_current_line(self) -> "EditorLine":
-        curr = None if not self._lines else self._lines[self._line_idx]
-        begin = 0 if curr is None else curr.begin
-        end = self._cursor if not curr else curr.end
-        return EditorLine(begin, end)
+    def _current_line_range(self) -> tuple[int, int]:
+        begin = self._line_start(self._line_idx)
+        end = self._line_end(self._line_idx)
+        return (begin, end if end > begin else self._cursor)
 
-    def _get_line_text(self, line: "EditorLine") -> str:
-        return self._text[line.begin:line.end]
+    def _current_content_end(self, end: int) -> int:
+        if self._line_idx + 1 < len(self._line_begins):
+            return end - 1
+        return end
 
     def _correct_cursor_position(self) -> None:
-        current_line = self._get_current_line()
-        self._cursor = min(self._cursor, current_line.end - 1)
-        if len(current_line) > 1 and self._text[self._cursor] == "\n":
+        begin, end = self._current_line_range()
+        self._cursor = min(self._cursor, end - 1)
+        if end - begin > 1 and self._cursor == self._current_content_end(end):
             self._cursor -= 1
 
-        self._cursor = max(self._cursor, current_line.begin)
+        self._cursor = max(self._cursor, begin)
 
     def _skip_whitespace_forward(self) -> int:
+        text = self._text
         idx = self._cursor + 1
-        while idx + 1 < len(self._text) and self._text[idx] in string.whitespace:
-            if self._text[idx] == "\n":
-                self._line_idx += 1
-
-            idx += 1
+        if idx + 1 < len(text):
+            stop = text.search_char(_NON_WHITESPACE_RE, idx, len(text) - 1)
+            idx = len(text) - 1 if stop < 0 else stop
 
         self._cursor = idx
+        self._refresh_line_idx()
         return idx
 
     def _skip_whitespace_backward(self) -> int:
+        text = self._text
         idx = self._cursor - 1
-        while idx > 0 and self._text[idx] in string.whitespace:
-            if self._text[idx] == "\n":
-                self._line_idx -= 1
-
-            idx -= 1
+        if idx > 0:
+            idx = max(text.rsearch_char(_NON_WHITESPACE_RE, 1, idx + 1), 0)
 
         self._cursor = idx
+        self._refresh_line_idx()
         return idx
 
 
@@ -295,13 +437,208 @@ class EditorMode(Enum):
     INSERT = auto()
 
 
-@dataclass
-class EditorLine:
-    begin: int
-    end: int
+class _AsciiChars:
+    data: bytearray
+
+    def __init__(self, text: str) -> None:
+        self.data = bytearray(text, "ascii")
+
+    def read(self, start: int, stop: int) -> str:
+        return self.data[start:stop].decode("ascii")
+
+    def write(self, pos: int, text: str) -> None:
+        if len(text) == 1:
+            self.data[pos] = ord(text)
+        else:
+            self.data[pos:pos + len(text)] = text.encode("ascii")
+
+    def move(self, dst: int, src: int, count: int) -> None:
+        self.data[dst:dst + count] = self.data[src:src + count]
+
+    def grow(self, pos: int, size: int) -> None:
+        self.data[pos:pos] = bytes(size)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, idx: int) -> str:
+        return chr(self.data[idx])
+
+
+class _WideChars:
+    data: "array[str]"
+
+    def __init__(self, text: str) -> None:
+        self.data = array(_CHAR_TYPECODE, text)
+
+    def read(self, start: int, stop: int) -> str:
+        return self.data[start:stop].tounicode()
+
+    def write(self, pos: int, text: str) -> None:
+        if len(text) == 1:
+            self.data[pos] = text
+        else:
+            self.data[pos:pos + len(text)] = array(_CHAR_TYPECODE, text)
+
+    def move(self, dst: int, src: int, count: int) -> None:
+        self.data[dst:dst + count] = self.data[src:src + count]
+
+    def grow(self, pos: int, size: int) -> None:
+        self.data[pos:pos] = array(_CHAR_TYPECODE, "\0") * size
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, idx: int) -> str:
+        return self.data[idx]
+
+
+class GapBuffer:
+    MIN_GAP_SIZE = 64
+    SCAN_WINDOW = 256
+
+    _buf: Union[_AsciiChars, _WideChars]
+    _gap_start: int
+    _gap_end: int
+
+    def __init__(self, text: str = "") -> None:
+        self._buf = _AsciiChars(text) if text.isascii() else _WideChars(text)
+        self._gap_start = len(self._buf)
+        self._gap_end = self._gap_start
+        self._grow(GapBuffer.MIN_GAP_SIZE)
+
+    def insert(self, pos: int, text: str) -> None:
+        if isinstance(self._buf, _AsciiChars) and not text.isascii():
+            self._buf = _WideChars(self._buf.read(0, len(self._buf)))
+
+        self.move_gap_to(pos)
+        if len(text) > self._gap_end - self._gap_start:
+            self._grow(max(len(text), len(self._buf), GapBuffer.MIN_GAP_SIZE))
+
+        self._buf.write(self._gap_start, text)
+        self._gap_start += len(text)
+
+    def delete(self, pos: int, count: int) -> None:
+        self.move_gap_to(pos)
+        self._gap_end = min(self._gap_end + max(count, 0), len(self._buf))
+
+    def move_gap_to(self, pos: int) -> None:
+        pos = max(min(pos, len(self)), 0)
+        if pos < self._gap_start:
+            count = self._gap_start - pos
+            self._buf.move(self._gap_end - count, pos, count)
+            self._gap_start -= count
+            self._gap_end -= count
+        elif pos > self._gap_start:
+            count = pos - self._gap_start
+            self._buf.move(self._gap_start, self._gap_end, count)
+            self._gap_start += count
+            self._gap_end += count
+
+    def find(self, sub: str, start: int = 0, end: Optional[int] = None) -> int:
+        start = max(start, 0)
+        end = len(self) if end is None else min(end, len(self))
+        window = GapBuffer.SCAN_WINDOW
+        while start < end:
+            stop = min(start + window, end)
+            idx = self[start:min(stop + len(sub) - 1, end)].find(sub)
+            if idx >= 0:
+                return start + idx
+
+            start = stop
+            window *= 2
+
+        return -1
+
+    def rfind(self, sub: str, start: int = 0, end: Optional[int] = None) -> int:
+        start = max(start, 0)
+        end = len(self) if end is None else min(end, len(self))
+        window = GapBuffer.SCAN_WINDOW
+        while start < end:
+            begin = max(end - window, start)
+            idx = self[begin:end].rfind(sub)
+            if idx >= 0:
+                return begin + idx
+
+            if begin == start:
+                break
+
+            end = begin + len(sub) - 1
+            window *= 2
+
+        return -1
+
+    def search_char(
+            self,
+            pattern: "re.Pattern[str]",
+            start: int = 0,
+            end: Optional[int] = None) -> int:
+        start = max(start, 0)
+        end = len(self) if end is None else min(end, len(self))
+        window = GapBuffer.SCAN_WINDOW
+        while start < end:
+            stop = min(start + window, end)
+            match = pattern.search(self[start:stop])
+            if match:
+                return start + match.start()
+
+            start = stop
+            window *= 2
+
+        return -1
+
+    def rsearch_char(
+            self,
+            pattern: "re.Pattern[str]",
+            start: int = 0,
+            end: Optional[int] = None) -> int:
+        start = max(start, 0)
+        end = len(self) if end is None else min(end, len(self))
+        window = GapBuffer.SCAN_WINDOW
+        while start < end:
+            begin = max(end - window, start)
+            match = pattern.search(self[begin:end][::-1])
+            if match:
+                return end - 1 - match.start()
+
+            end = begin
+            window *= 2
+
+        return -1
+
+    def chunks(self) -> Iterator[str]:
+        yield self._buf.read(0, self._gap_start)
+        yield self._buf.read(self._gap_end, len(self._buf))
+
+    def _grow(self, size: int) -> None:
+        self._buf.grow(self._gap_end, size)
+        self._gap_end += size
+
+    def _slice(self, start: int, stop: int) -> str:
+        gap = self._gap_end - self._gap_start
+        if stop <= self._gap_start:
+            return self._buf.read(start, stop)
+        if start >= self._gap_start:
+            return self._buf.read(start + gap, stop + gap)
+        return (self._buf.read(start, self._gap_start)
+                + self._buf.read(self._gap_end, stop + gap))
 
     def __len__(self) -> int:
-        return max(self.end - self.begin, 0)
+        return len(self._buf) - (self._gap_end - self._gap_start)
+
+    def __getitem__(self, key: Union[int, slice]) -> str:
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError("slice step is not supported")
+            return self._slice(start, max(start, stop))
+
+        idx = key + len(self) if key < 0 else key
+        if idx < 0 or idx >= len(self):
+            raise IndexError("gap buffer index out of range")
+        if idx >= self._gap_start:
+            idx += self._gap_end - self._gap_start
+        return self._buf[idx]
 
 
 class NoTTYException(Exception):
@@ -319,25 +656,60 @@ class Terminal:
     CTRL_SPACE = "\x00"
     BS = "\x7F"
     DEL = "\x1b[3~"
+    CLEAR = b"\033[H\033[J"
+    ESCAPE_TIMEOUT = 0.01
+    READ_SIZE = 64
+    ESCAPE_DFA: _EscapeNode = dict.fromkeys(
+        "\x4F\x5B",
+        dict.fromkeys(
+            "\x31\x32\x33\x35\x36",
+            dict.fromkeys("\x30\x31\x33\x34\x35\x37\x38\x39", {})))
 
     stdin: TextIO
     stdout: TextIO
 
+    _fd: int
+    _out_fd: int
+    _out_encoding: str
     _term_settings: list[Any]
+    _cached_size: Optional[TerminalSize]
+    _pending: str
+    _decoder: codecs.IncrementalDecoder
 
     def __init__(self, stdin: Optional[TextIO] = None, stdout: Optional[TextIO] = None):
         self.stdin = stdin or sys.stdin
         self.stdout = stdout or sys.stdout
+        self._fd = self.stdin.fileno()
+        self._out_fd = self.stdout.fileno()
+        self._out_encoding = self.stdout.encoding or "utf-8"
+        self._cached_size = None
+        self._pending = ""
+        self._decoder = codecs.getincrementaldecoder(self.stdin.encoding or "utf-8")("replace")
 
         if not self.stdin.isatty() or not self.stdout.isatty():
             raise NoTTYException()
 
-    def get_size(self):
-        tmp = os.get_terminal_size(self.stdout.fileno())
-        return TerminalSize(tmp.lines, tmp.columns)
+    def get_size(self) -> TerminalSize:
+        if self._cached_size is None:
+            tmp = os.get_terminal_size(self._out_fd)
+            self._cached_size = TerminalSize(tmp.lines, tmp.columns)
+        return self._cached_size
+
+    def invalidate_size(self) -> None:
+        self._cached_size = None
 
     def read_char(self) -> str:
-        return sys.stdin.read(1)
+        while not self._pending:
+            data = os.read(self._fd, Terminal.READ_SIZE)
+            if not data:
+                return ""
+            self._pending = self._decoder.decode(data)
+
+        c, self._pending = self._pending[0], self._pending[1:]
+        return c
+
+    def has_pending_input(self) -> bool:
+        return bool(self._pending) or self._read_pending(0)
 
     def read_key(self) -> str:
         c1 = self.read_char()
@@ -348,48 +720,40 @@ class Terminal:
         if c1 != "\x1B":
             return c1
 
-        c2 = self.read_char()
-        if c2 not in "\x4F\x5B":
-            return c1 + c2
-
-        c3 = self.read_char()
-        if c3 not in "\x31\x32\x33\x35\x36":
-            return c1 + c2 + c3
+        if not self._pending and not self._read_pending(Terminal.ESCAPE_TIMEOUT):
+            return c1
 
-        c4 = self.read_char()
-        if c4 not in "\x30\x31\x33\x34\x35\x37\x38\x39":
-            return c1 + c2 + c3 + c4
+        key = [c1]
+        node: Optional[_EscapeNode] = Terminal.ESCAPE_DFA
+        while node is not None:
+            c = self.read_char()
+            key.append(c)
+            node = node.get(c)
 
-        c5 = self.read_char()
-        return c1 + c2 + c3 + c4 + c5
+        return "".join(key)
 
-    def write(self, text: str) -> None:
-        self.stdout.write(text)
+    def write_bytes(self, data: Union[bytes, bytearray]) -> None:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self._out_fd, view):]
 
-    def flush(self) -> None:
-        self.stdout.flush()
+    def encode(self, text: str) -> bytes:
+        return text.encode(self._out_encoding, "replace")
 
     def clear(self):
-        self.ansi_escape("[H")
-        self.ansi_escape("[J")
-
-    def move_cursor(self, line: int, column: int):
-        size = self.get_size()
-        if line < 0 or line > size.lines:
-            raise ValueError(f"line has to be greater than 0 and less than {size.lines + 1}")
-        if column < 0 or column > size.columns:
-            raise ValueError(f"column has to be greater than 0 and less than {size.columns + 1}")
-        self.ansi_escape(f"[{line};{column}H")
+        self.write_bytes(Terminal.CLEAR)
 
-    def ansi_escape(self, code: str) -> None:
-        self.write(f"\033{code}")
+    def _read_pending(self, timeout: float) -> bool:
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if ready:
+            self._pending += self._decoder.decode(os.read(self._fd, Terminal.READ_SIZE))
+        return bool(self._pending)
 
     def __enter__(self) -> "Terminal":
-        fd = self.stdin.fileno()
-        self._term_settings = termios.tcgetattr(fd)
-        settings = termios.tcgetattr(fd)
+        self._term_settings = termios.tcgetattr(self._fd)
+        settings = termios.tcgetattr(self._fd)
         settings[3] &= ~(termios.ECHO | termios.ICANON | termios.IGNBRK | termios.BRKINT)
-        termios.tcsetattr(fd, termios.TCSAFLUSH, settings)
+        termios.tcsetattr(self._fd, termios.TCSAFLUSH, settings)
         return self
 
     def __exit__(
@@ -398,12 +762,13 @@ class Terminal:
             exc_val: Optional[BaseException],
             exc_tb: Optional[TracebackType]) -> None:
         self.clear()
-        termios.tcsetattr(self.stdin.fileno(), termios.TCSADRAIN, self._term_settings)
+        termios.tcsetattr(self._fd, termios.TCSADRAIN, self._term_settings)
 
 
 @dataclass
 class ViewData:
-    lines: Iterable[str]
+    get_lines: Callable[[int, int, int, int], Iterator[str]]
+    line_count: int
     mode: EditorMode
     cursor_line: int
     cursor_column: int
@@ -417,53 +782,98 @@ class ViewCursor:
 
 class View:
     MIN_LINE_NUMBER_WIDTH = 5
+    MODE_STRINGS = {
+        EditorMode.NORMAL: "-- NORMAL --",
+        EditorMode.INSERT: "-- INSERT --",
+    }
 
     terminal: Terminal
 
+    _prev_lines: list[str]
+    _scratch: bytearray
+    _rendering: bool
+    _invalidated: bool
+    _mode_line_cache: Optional[tuple[tuple[int, EditorMode, int, int], str]]
+
     def __init__(self, terminal: Terminal) -> None:
         self.terminal = terminal
+        self._prev_lines = []
+        self._scratch = bytearray()
+        self._rendering = False
+        self._invalidated = False
+        self._mode_line_cache = None
 
     def get_key(self) -> str:
         return self.terminal.read_key()
 
+    def has_pending_key(self) -> bool:
+        return self.terminal.has_pending_input()
+
     def rerender(self, data: ViewData) -> None:
-        self.terminal.clear()
-        line_number_width, lines = self._get_view_lines(data)
-        lines.append(self._get_mode_line(data))
-        assert len(lines) == self.terminal.get_size().lines
-        self.terminal.write("".join(lines))
-        view_cursor = self._get_cursor(data, line_number_width)
-        self.terminal.move_cursor(
-            view_cursor.line, view_cursor.column)
-        self.terminal.flush()
-
-    def _get_cursor(self, data: ViewData, line_number_width: int) -> ViewCursor:
+        if self._rendering:
+            return
+
+        self._rendering = True
+        try:
+            self._render_frame(data)
+            while self._invalidated:
+                self._prev_lines = []
+                self._render_frame(data)
+        finally:
+            self._rendering = False
+
+    def invalidate(self) -> None:
+        self.terminal.invalidate_size()
+        self._prev_lines = []
+        self._invalidated = True
+
+    def _render_frame(self, data: ViewData) -> None:
+        self._invalidated = False
+        size = self.terminal.get_size()
+        line_number_width, lines = self._get_view_lines(data, size)
+        lines.append(self._get_mode_line(data, size))
+        buf = self._scratch
+        del buf[:]
+        for idx, (old, new) in enumerate(zip_longest(self._prev_lines, lines)):
+            if new is not None and new != old:
+                buf += b"\033[%d;1H" % (idx + 1)
+                buf += self.terminal.encode(new)
+
+        self._prev_lines = lines
+        view_cursor = self._get_cursor(data, line_number_width, size)
+        buf += b"\033[%d;%dH" % (view_cursor.line, view_cursor.column)
+        self.terminal.write_bytes(buf)
+
+    def _get_cursor(
+            self,
+            data: ViewData,
+            line_number_width: int,
+            size: TerminalSize) -> ViewCursor:
         assert line_number_width >= View.MIN_LINE_NUMBER_WIDTH
-        max_view_lines = self.terminal.get_size().lines - 1
+        max_view_lines = size.lines - 1
         view_cursor_line = data.cursor_line - max(data.cursor_line - max_view_lines, 0)
-        columns = self.terminal.get_size().columns
+        columns = size.columns - line_number_width
         view_cursor_column = (line_number_width
                               + data.cursor_column
                               - max(data.cursor_column - columns, 0))
         return ViewCursor(view_cursor_line, view_cursor_column)
 
-    def _get_view_lines(self, data: ViewData) -> tuple[int, list[str]]:
+    def _get_view_lines(self, data: ViewData, size: TerminalSize) -> tuple[int, list[str]]:
         res: list[str] = []
-        max_view_lines = self.terminal.get_size().lines - 1
+        max_view_lines = size.lines - 1
         begin = max(data.cursor_line - max_view_lines, 0)
-        end = begin + max_view_lines
-        lines = list(data.lines)
-        max_line_number = len(lines)
+        end = min(begin + max_view_lines, data.line_count)
+        max_line_number = data.line_count
         line_number_width = max(len(str(max_line_number)) + 2, View.MIN_LINE_NUMBER_WIDTH)
-        for line_number, line in enumerate(lines[begin:end], start = begin + 1):
+        columns = size.columns - line_number_width
+        offset = max(data.cursor_column - columns, 0)
+        lines = data.get_lines(begin, end, offset, offset + columns)
+        for line_number, text in enumerate(lines, begin + 1):
             formatted = self._format_line_number(
                 line_number, data.cursor_line, line_number_width)
-            res.append(self._get_view_line(line, data.cursor_column, formatted))
+            res.append(self._get_view_line(text, formatted, columns))
 
-        empty_view_lines = max_view_lines - len(res)
-        while empty_view_lines:
-            res.append("~\n")
-            empty_view_lines -= 1
+        res.extend(["~\033[K\n"] * (max_view_lines - len(res)))
 
         return (line_number_width, res)
 
@@ -473,90 +883,122 @@ class View:
             cursor_line: int,
             line_number_width: int) -> str:
         padding = 1 if line_number != cursor_line else 2
-        return (str(line_number).rjust(line_number_width - padding, " ")
-                + " " * padding)
+        return f"{line_number:>{line_number_width - padding}}{' ' * padding}"
 
-    def _get_view_line(self, line: str, cursor_column: int, line_number: str) -> str:
-        columns = self.terminal.get_size().columns - len(line_number)
-        begin = max(cursor_column - columns, 0)
-        view_line = line_number + line[begin:begin+columns]
-        if view_line.endswith("\n"): return view_line
-        return view_line + "\n"
+    def _get_view_line(self, text: str, line_number: str, columns: int) -> str:
+        if text[-1:] == "\n": text = text[:-1]
+        if len(text) < columns: return f"{line_number}{text}\033[K\n"
+        return f"{line_number}{text}\n"
+
+    def _get_mode_line(self, data: ViewData, size: TerminalSize) -> str:
+        key = (size.columns, data.mode, data.cursor_line, data.cursor_column)
+        if self._mode_line_cache is not None and self._mode_line_cache[0] == key:
+            return self._mode_line_cache[1]
 
-    def _get_mode_line(self, data: ViewData) -> str:
         pos = f"Ln {data.cursor_line}, Col {data.cursor_column}"
-        mode_string = f"-- {'INSERT' if data.mode == EditorMode.INSERT else 'NORMAL'} --"
-        columns = self.terminal.get_size().columns
-        return mode_string + pos.rjust(columns - len(mode_string), " ")
+        mode_string = View.MODE_STRINGS[data.mode]
+        mode_line = mode_string + pos.rjust(size.columns - len(mode_string), " ")
+        self._mode_line_cache = (key, mode_line)
+        return mode_line
 
 
 class Controller:
     view: View
     editor: Editor
 
+    _normal_dispatch: dict[str, Union[Callable[[], None], dict[str, Callable[[], None]]]]
+    _insert_dispatch: dict[str, Callable[[], None]]
+    _pending_dispatch: Optional[dict[str, Callable[[], None]]]
+
     def __init__(self, view: View, editor: Editor):
         self.editor = editor
         self.view = view
+        self._pending_dispatch = None
+        self._normal_dispatch = {
+            "h": editor.move_left,
+            "j": editor.move_down,
+            "k": editor.move_up,
+            "l": editor.move_right,
+            "w": editor.move_word_forward,
+            "b": editor.move_word_backward,
+            "e": editor.move_to_end_of_word,
+            "0": editor.move_to_beginning_of_line,
+            "$": editor.move_to_end_of_line,
+            "{": editor.move_paragraph_backward,
+            "}": editor.move_paragraph_forward,
+            "a": self._append,
+            "A": self._append_to_line,
+            "i": editor.switch_to_insert_mode,
+            "I": self._insert_at_line_start,
+            "o": self._open_line_below,
+            "O": self._open_line_above,
+            "x": editor.delete_character,
+            Terminal.DEL: editor.delete_character,
+            "d": {"d": editor.delete_line},
+            "s": editor.save,
+        }
+        self._insert_dispatch = {
+            Terminal.CTRL_SPACE: editor.switch_to_normal_mode,
+            Terminal.BS: editor.back_delete_character,
+            Terminal.DEL: editor.delete_character,
+        }
 
         def handle_resize(signal: int, frame: Optional[FrameType]) -> None:
+            self.view.invalidate()
             self.rerender()
 
         signal.signal(signal.SIGWINCH, handle_resize)
 
     def rerender(self):
         self.view.rerender(self._get_view_data())
+        self.editor.mark_clean()
 
     def loop(self) -> None:
         while True:
-            self.rerender()
+            if self.editor.dirty and not self.view.has_pending_key():
+                self.rerender()
             cmd = self.view.get_key()
             if self.editor.mode == EditorMode.NORMAL:
-                match cmd:
-                    case "h": self.editor.move_left()
-                    case "j": self.editor.move_down()
-                    case "k": self.editor.move_up()
-                    case "l": self.editor.move_right()
-                    case "w": self.editor.move_word_forward()
-                    case "b": self.editor.move_word_backward()
-                    case "e": self.editor.move_to_end_of_word()
-                    case "0": self.editor.move_to_beginning_of_line()
-                    case "$": self.editor.move_to_end_of_line()
-                    case "{": self.editor.move_paragraph_backward()
-                    case "}": self.editor.move_paragraph_forward()
-                    case "a": self.editor.switch_to_insert_mode(append=True)
-                    case "A":
-                        self.editor.move_to_end_of_line()
-                        self.editor.switch_to_insert_mode(append=True)
-                    case "i": self.editor.switch_to_insert_mode()
-                    case "I":
-                        self.editor.move_to_beginning_of_line()
-                        self.editor.switch_to_insert_mode()
-                    case "o":
-                        self.editor.insert_newline_below()
-                        self.editor.switch_to_insert_mode()
-                    case "O":
-                        self.editor.insert_newline_above()
-                        self.editor.switch_to_insert_mode()
-                    case "x" | Terminal.DEL: self.editor.delete_character()
-                    case "d":
-                        cmd += self.view.get_key()
-                        if cmd == "dd":
-                            self.editor.delete_line()
-                    case "s": self.editor.save()
-                    case "q": return
-                    case _: pass
+                if cmd == "q" and self._pending_dispatch is None:
+                    return
+
+                dispatch = self._pending_dispatch or self._normal_dispatch
+                self._pending_dispatch = None
+                command = dispatch.get(cmd)
+                if isinstance(command, dict):
+                    self._pending_dispatch = command
+                elif command:
+                    command()
             elif self.editor.mode == EditorMode.INSERT:
-                match cmd:
-                    case Terminal.CTRL_SPACE: self.editor.switch_to_normal_mode()
-                    case Terminal.BS: self.editor.back_delete_character()
-                    case Terminal.DEL: self.editor.delete_character()
-                    case _:
-                        if cmd in string.printable:
-                            self.editor.insert(cmd)
+                command = self._insert_dispatch.get(cmd)
+                if command:
+                    command()
+                elif cmd in _PRINTABLE:
+                    self.editor.insert(cmd)
+
+    def _append(self) -> None:
+        self.editor.switch_to_insert_mode(append=True)
+
+    def _append_to_line(self) -> None:
+        self.editor.move_to_end_of_line()
+        self.editor.switch_to_insert_mode(append=True)
+
+    def _insert_at_line_start(self) -> None:
+        self.editor.move_to_beginning_of_line()
+        self.editor.switch_to_insert_mode()
+
+    def _open_line_below(self) -> None:
+        self.editor.insert_newline_below()
+        self.editor.switch_to_insert_mode()
+
+    def _open_line_above(self) -> None:
+        self.editor.insert_newline_above()
+        self.editor.switch_to_insert_mode()
 
     def _get_view_data(self) -> ViewData:
         return ViewData(
-            self.editor.get_lines(),
+            self.editor.get_lines,
+            self.editor.line_count,
             self.editor.mode,
             self.editor.cursor_line,
             self.editor.cursor_column)
@@ -564,11 +1006,19 @@ class Controller:
 
 def get_file(file_path: str) -> File:
     try:
-        with open(file_path, "r") as f:
-            return File(f.read(), f.name, f.encoding)
+        with open(file_path, "rb") as f:
+            data = f.read()
     except FileNotFoundError:
         return File(text="", path=file_path)
 
+    encoding = locale.getpreferredencoding(False)
+    text = data.decode(encoding)
+    newline = "\n"
+    if "\r" in text:
+        newline = "\r\n" if "\r\n" in text else "\r"
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return File(text, file_path, encoding, newline)
+
 
 def error(msg: str) -> int:
     print(f"ERROR: {msg}", file=sys.stderr)
@@ -588,6 +1038,8 @@ def main(argv: list[str]) -> int:
             controller.loop()
     except OSError as e:
         return error(f"could not open file {file_path}: {e}")
+    except UnicodeError as e:
+        return error(f"could not read or write file {file_path}: {e}")
     except NoTTYException:
         return error(f"please run in the terminal")
 